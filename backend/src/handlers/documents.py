@@ -3,13 +3,23 @@ Documents CRUD Lambda Handler
 
 Handles listing, getting, and deleting documents.
 """
+import base64
 import json
-import boto3
 import os
 
-s3 = boto3.client('s3')
+from utils.aws import client
+from utils.dynamodb import get_document, get_user_documents, delete_document
+from utils.s3_presign import get_presigner
+from utils.storage import derived_prefix, load_document_text, upload_folder
+from utils.http import response
+from utils.auth import get_user_id
+
+s3 = client('s3')
 BUCKET_NAME = os.environ.get('DOCUMENTS_BUCKET', 'documind-documents')
 
+# Key attributes of a userId-createdAt-index page key (table key + index key)
+PAGE_KEY_ATTRIBUTES = frozenset({'documentId', 'userId', 'createdAt'})
+
 
 def lambda_handler(event, context):
     """
@@ -42,31 +52,45 @@ def lambda_handler(event, context):
 
 def list_documents_handler(event):
     """List all documents for the current user."""
-    from utils.dynamodb import get_user_documents
-    
     user_id = get_user_id(event)
     
     # Get query parameters
     query_params = event.get('queryStringParameters', {}) or {}
     limit = min(int(query_params.get('limit', 50)), 100)
     
-    documents = get_user_documents(user_id, limit)
+    start_key = None
+    if query_params.get('nextToken'):
+        try:
+            start_key = json.loads(base64.urlsafe_b64decode(query_params['nextToken']))
+        except ValueError:
+            return response(400, {'error': 'Invalid nextToken'})
+        if not _is_page_key(start_key, user_id):
+            return response(400, {'error': 'Invalid nextToken'})
     
-    # Remove extracted text from list view (too large)
-    for doc in documents:
-        doc.pop('extractedText', None)
-        doc.pop('queryHistory', None)
+    documents, last_key = get_user_documents(user_id, limit, start_key)
     
-    return response(200, {
+    result = {
         'documents': documents,
         'count': len(documents)
-    })
+    }
+    if last_key:
+        result['nextToken'] = base64.urlsafe_b64encode(json.dumps(last_key).encode()).decode()
+    
+    return response(200, result)
+
+
+def _is_page_key(start_key, user_id):
+    """Check a decoded nextToken is a page key from this user's listing."""
+    return (
+        isinstance(start_key, dict)
+        and start_key.keys() == PAGE_KEY_ATTRIBUTES
+        and all(isinstance(value, str) for value in start_key.values())
+        and start_key['userId'] == user_id
+    )
 
 
 def get_document_handler(event, document_id):
     """Get a specific document by ID."""
-    from utils.dynamodb import get_document
-    
     document = get_document(document_id)
     
     if not document:
@@ -82,31 +106,23 @@ def get_document_handler(event, document_id):
     include_text = query_params.get('includeText', 'false').lower() == 'true'
     include_history = query_params.get('includeHistory', 'false').lower() == 'true'
     
-    # Optionally exclude large fields
-    if not include_text:
+    # Optionally include large fields
+    if include_text:
+        document['extractedText'] = load_document_text(document)
+    else:
         document.pop('extractedText', None)
     if not include_history:
         document.pop('queryHistory', None)
     
     # Generate download URL
     if document.get('s3Key'):
-        download_url = s3.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': BUCKET_NAME,
-                'Key': document['s3Key']
-            },
-            ExpiresIn=3600
-        )
-        document['downloadUrl'] = download_url
+        document['downloadUrl'] = get_presigner(BUCKET_NAME).presigned_get(document['s3Key'], expires=3600)
     
     return response(200, {'document': document})
 
 
 def delete_document_handler(event, document_id):
     """Delete a document."""
-    from utils.dynamodb import get_document, delete_document
-    
     if not document_id:
         return response(400, {'error': 'documentId is required'})
     
@@ -121,12 +137,24 @@ def delete_document_handler(event, document_id):
     if document.get('userId') != user_id and user_id != 'anonymous':
         return response(403, {'error': 'Access denied'})
     
-    # Delete from S3
-    if document.get('s3Key'):
+    # Delete any derived artifacts
+    try:
+        delete_prefix(derived_prefix(document_id))
+    except Exception as e:
+        print(f"Warning: Could not delete derived objects for {document_id}: {str(e)}")
+    
+    # Delete the upload; only wipe its folder when the key is the one we
+    # issued for this owner and document, otherwise just the one object
+    s3_key = document.get('s3Key')
+    if s3_key:
+        folder = upload_folder(s3_key, document.get('userId', ''), document_id)
         try:
-            s3.delete_object(Bucket=BUCKET_NAME, Key=document['s3Key'])
+            if folder:
+                delete_prefix(folder)
+            else:
+                s3.delete_object(Bucket=BUCKET_NAME, Key=s3_key)
         except Exception as e:
-            print(f"Warning: Could not delete S3 object: {str(e)}")
+            print(f"Warning: Could not delete S3 object {s3_key}: {str(e)}")
     
     # Delete from DynamoDB
     delete_document(document_id)
@@ -137,27 +165,13 @@ def delete_document_handler(event, document_id):
     })
 
 
-def get_user_id(event):
-    """Extract user ID from request context or headers."""
-    request_context = event.get('requestContext', {})
-    authorizer = request_context.get('authorizer', {})
-    
-    if 'claims' in authorizer:
-        return authorizer['claims'].get('sub', 'anonymous')
-    
-    headers = event.get('headers', {}) or {}
-    return headers.get('X-User-Id', 'anonymous')
-
-
-def response(status_code, body):
-    """Generate API Gateway response."""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-User-Id,Authorization',
-            'Access-Control-Allow-Methods': 'GET,POST,DELETE,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
-    }
+def delete_prefix(prefix):
+    """Delete every object under an S3 prefix, up to 1000 keys per request."""
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+        for i in range(0, len(keys), 1000):
+            s3.delete_objects(
+                Bucket=BUCKET_NAME,
+                Delete={'Objects': keys[i:i + 1000], 'Quiet': True}
+            )
@@ -5,12 +5,19 @@ Extracts text from documents using Amazon Textract.
 Triggered by S3 upload events or API requests.
 """
 import json
-import boto3
 import os
 import urllib.parse
 
-s3 = boto3.client('s3')
+from utils.textract import (
+    extract_text_from_s3, extract_text_from_pdf_bytes, start_async_analysis, get_async_results
+)
+from utils.dynamodb import get_document, store_extracted_text, update_document_status
+from utils.http import response
+from utils.storage import get_object_bytes, load_document_text
+
 BUCKET_NAME = os.environ.get('DOCUMENTS_BUCKET', 'documind-documents')
+TEXTRACT_TOPIC_ARN = os.environ.get('TEXTRACT_TOPIC_ARN', '')
+TEXTRACT_ROLE_ARN = os.environ.get('TEXTRACT_ROLE_ARN', '')
 
 
 def lambda_handler(event, context):
@@ -18,13 +25,16 @@ def lambda_handler(event, context):
     Handle text extraction requests.
     
     Can be triggered by:
-    1. S3 event (automatic extraction on upload)
-    2. API Gateway (manual extraction request)
+    1. S3 event (start asynchronous extraction on upload)
+    2. SNS notification (Textract job finished)
+    3. API Gateway (manual extraction request)
     """
     try:
-        # Check if this is an S3 event
         if 'Records' in event:
-            return handle_s3_event(event)
+            # Textract completion notifications arrive via SNS
+            if event['Records'] and event['Records'][0].get('EventSource') == 'aws:sns':
+                return finish_extract(event)
+            return start_extract(event)
         
         # Otherwise, it's an API request
         return handle_api_request(event)
@@ -34,11 +44,8 @@ def lambda_handler(event, context):
         return response(500, {'error': 'Internal server error', 'message': str(e)})
 
 
-def handle_s3_event(event):
-    """Process S3 upload event and extract text."""
-    from utils.textract import extract_text_from_s3
-    from utils.dynamodb import get_document, store_extracted_text, update_document_status
-    
+def start_extract(event):
+    """Process S3 upload event and start an asynchronous Textract job."""
     for record in event.get('Records', []):
         bucket = record['s3']['bucket']['name']
         key = urllib.parse.unquote_plus(record['s3']['object']['key'])
@@ -46,43 +53,76 @@ def handle_s3_event(event):
         print(f"Processing document: s3://{bucket}/{key}")
         
         # Find document ID from key
-        # Expected format: documents/{userId}/{date}/{documentId}/{filename}
+        # Expected format: documents/{userId}/{yyyy}/{mm}/{dd}/{documentId}/{filename}
+        # Index from the end; filenames can't contain "/" but user IDs might
         parts = key.split('/')
-        if len(parts) >= 4:
-            document_id = parts[3]
+        if len(parts) >= 7 and parts[0] == 'documents':
+            document_id = parts[-2]
         else:
             print(f"Could not extract document ID from key: {key}")
             continue
         
-        # Update status to processing
+        # Update status to processing; this creates the record if the client
+        # has not posted its metadata yet
         update_document_status(document_id, 'PROCESSING')
         
         try:
-            # Extract text using Textract
-            result = extract_text_from_s3(bucket, key)
+            # Textract notifies finish_extract via SNS when the job is done
+            job_id = start_async_analysis(
+                bucket, key, TEXTRACT_TOPIC_ARN, TEXTRACT_ROLE_ARN, job_tag=document_id
+            )
+            update_document_status(
+                document_id, 'EXTRACTING', {'textractJobId': job_id}, must_exist=True
+            )
+            
+            print(f"Started Textract job {job_id} for document {document_id}")
             
-            # Store extracted text
-            store_extracted_text(
+        except Exception as e:
+            print(f"Error starting extraction for {document_id}: {str(e)}")
+            update_document_status(document_id, 'FAILED', {'errorMessage': str(e)}, must_exist=True)
+    
+    return {'statusCode': 200, 'body': 'Processing started'}
+
+
+def finish_extract(event):
+    """Process Textract job completion notifications and store the text."""
+    for record in event.get('Records', []):
+        message = json.loads(record['Sns']['Message'])
+        job_id = message['JobId']
+        document_id = message.get('JobTag')
+        
+        if not document_id:
+            print(f"Textract job {job_id} has no document tag")
+            continue
+        
+        try:
+            if message['Status'] != 'SUCCEEDED':
+                raise RuntimeError(f"Textract job {job_id} finished with status {message['Status']}")
+            
+            result = get_async_results(job_id)
+            
+            # Store extracted text; the document may have been deleted meanwhile
+            document = store_extracted_text(
                 document_id=document_id,
                 text=result['text'],
                 word_count=result['word_count'],
                 confidence=result['confidence']
             )
             
-            print(f"Successfully extracted {result['word_count']} words from document {document_id}")
+            if document is None:
+                print(f"Document {document_id} was deleted during extraction")
+            else:
+                print(f"Successfully extracted {result['word_count']} words from document {document_id}")
             
         except Exception as e:
             print(f"Error extracting text from {document_id}: {str(e)}")
-            update_document_status(document_id, 'FAILED', {'errorMessage': str(e)})
+            update_document_status(document_id, 'FAILED', {'errorMessage': str(e)}, must_exist=True)
     
     return {'statusCode': 200, 'body': 'Processing complete'}
 
 
 def handle_api_request(event):
     """Handle manual extraction request via API."""
-    from utils.textract import extract_text_from_s3
-    from utils.dynamodb import get_document, store_extracted_text, update_document_status
-    
     # Get document ID from path parameters
     path_params = event.get('pathParameters', {}) or {}
     document_id = path_params.get('documentId')
@@ -97,22 +137,27 @@ def handle_api_request(event):
         return response(404, {'error': 'Document not found'})
     
     # Check if already extracted
-    if document.get('status') == 'EXTRACTED' and document.get('extractedText'):
+    text = load_document_text(document) if document.get('status') == 'EXTRACTED' else None
+    if text:
         return response(200, {
             'documentId': document_id,
-            'text': document['extractedText'],
+            'text': text,
             'wordCount': document.get('wordCount', 0),
             'confidence': float(document.get('ocrConfidence', 0)),
             'cached': True
         })
     
     # Update status
-    update_document_status(document_id, 'PROCESSING')
+    update_document_status(document_id, 'PROCESSING', must_exist=True)
     
     try:
-        # Extract text
+        # Extract text; sync Textract only reads the first page of a PDF,
+        # so PDFs are split and their pages detected in parallel
         s3_key = document['s3Key']
-        result = extract_text_from_s3(BUCKET_NAME, s3_key)
+        if document.get('contentType') == 'application/pdf':
+            result = extract_text_from_pdf_bytes(get_object_bytes(s3_key))
+        else:
+            result = extract_text_from_s3(BUCKET_NAME, s3_key)
         
         # Store results
         store_extracted_text(
@@ -131,19 +176,6 @@ def handle_api_request(event):
         })
         
     except Exception as e:
-        update_document_status(document_id, 'FAILED', {'errorMessage': str(e)})
+        update_document_status(document_id, 'FAILED', {'errorMessage': str(e)}, must_exist=True)
         return response(500, {'error': 'Text extraction failed', 'message': str(e)})
 
-
-def response(status_code, body):
-    """Generate API Gateway response."""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-User-Id,Authorization',
-            'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
-    }
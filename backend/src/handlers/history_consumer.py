@@ -0,0 +1,51 @@
+"""
+Query History Consumer Lambda Handler
+
+Persists Q&A interactions queued by the query handler.
+Triggered by SQS with partial batch responses enabled.
+"""
+import json
+
+from utils.dynamodb import add_queries_to_history
+
+
+def lambda_handler(event, context):
+    """
+    Append queued Q&A interactions to document history.
+
+    Messages are grouped per document so each document gets a single
+    DynamoDB write per batch. Malformed messages and messages for
+    documents whose write fails are reported back to SQS for retry.
+    Messages for deleted documents are dropped.
+    """
+    batches = {}
+    failures = []
+    for record in event.get('Records', []):
+        try:
+            message = json.loads(record['body'])
+            entry = {
+                'question': message['question'],
+                'answer': message['answer'],
+                'timestamp': message['timestamp']
+            }
+            document_id = message['documentId']
+            if not isinstance(entry['timestamp'], str):
+                raise TypeError('timestamp must be a string')
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Malformed history message {record['messageId']}: {str(e)}")
+            failures.append({'itemIdentifier': record['messageId']})
+            continue
+        batches.setdefault(document_id, []).append((record['messageId'], entry))
+
+    for document_id, entries in batches.items():
+        # Standard queues don't preserve order
+        entries.sort(key=lambda entry: entry[1]['timestamp'])
+
+        try:
+            if not add_queries_to_history(document_id, [entry for _, entry in entries]):
+                print(f"Dropping {len(entries)} history entries for deleted document {document_id}")
+        except Exception as e:
+            print(f"Error storing history for {document_id}: {str(e)}")
+            failures.extend({'itemIdentifier': message_id} for message_id, _ in entries)
+
+    return {'batchItemFailures': failures}
@@ -3,10 +3,35 @@ Document Q&A Lambda Handler
 
 Handles questions about documents using Amazon Bedrock and RAG-style prompting.
 """
+import hashlib
 import json
 import os
+from collections import OrderedDict
+
+import fastjsonschema
+
+from utils.bedrock import answer_question
+from utils.dynamodb import get_document, add_query_to_history, get_cached_answer, put_cached_answer, now_iso
+from utils.http import response
+from utils.storage import load_document_text
+from utils.aws import client
 
 BUCKET_NAME = os.environ.get('DOCUMENTS_BUCKET', 'documind-documents')
+HISTORY_QUEUE_URL = os.environ.get('HISTORY_QUEUE_URL')
+
+sqs = client('sqs')
+
+# Answers kept in memory across warm invocations
+LOCAL_CACHE_SIZE = 512
+_local_cache = OrderedDict()
+
+validate_query = fastjsonschema.compile({
+    'type': 'object',
+    'required': ['question'],
+    'properties': {
+        'question': {'type': 'string', 'pattern': r'\S', 'maxLength': 1000}
+    }
+})
 
 
 def lambda_handler(event, context):
@@ -18,9 +43,6 @@ def lambda_handler(event, context):
     - question in request body
     """
     try:
-        from utils.bedrock import answer_question
-        from utils.dynamodb import get_document, add_query_to_history
-        
         # Get document ID
         path_params = event.get('pathParameters', {}) or {}
         document_id = path_params.get('documentId')
@@ -28,19 +50,15 @@ def lambda_handler(event, context):
         if not document_id:
             return response(400, {'error': 'documentId is required'})
         
-        # Parse request body
+        # Parse and validate request body
         try:
-            body = json.loads(event.get('body', '{}'))
+            body = validate_query(json.loads(event.get('body') or '{}'))
         except json.JSONDecodeError:
             return response(400, {'error': 'Invalid JSON body'})
+        except fastjsonschema.JsonSchemaException as e:
+            return response(400, {'error': e.message})
         
-        question = body.get('question', '').strip()
-        
-        if not question:
-            return response(400, {'error': 'question is required in request body'})
-        
-        if len(question) > 1000:
-            return response(400, {'error': 'Question too long (max 1000 characters)'})
+        question = body['question'].strip()
         
         # Get document
         document = get_document(document_id)
@@ -49,7 +67,7 @@ def lambda_handler(event, context):
             return response(404, {'error': 'Document not found'})
         
         # Check if text has been extracted
-        extracted_text = document.get('extractedText')
+        extracted_text = load_document_text(document)
         
         if not extracted_text:
             return response(400, {
@@ -57,17 +75,18 @@ def lambda_handler(event, context):
                 'hint': 'Call the extract endpoint first'
             })
         
-        # Get answer using Bedrock
-        result = answer_question(extracted_text, question)
+        # Get answer from cache, falling back to Bedrock
+        result, cached = get_answer(document_id, extracted_text, question)
         
         # Store in query history
-        add_query_to_history(document_id, question, result['answer'])
+        record_query(document_id, question, result['answer'])
         
         return response(200, {
             'documentId': document_id,
             'question': question,
             'answer': result['answer'],
-            'confidence': result['confidence']
+            'confidence': result['confidence'],
+            'cached': cached
         })
         
     except Exception as e:
@@ -75,15 +94,57 @@ def lambda_handler(event, context):
         return response(500, {'error': 'Query failed', 'message': str(e)})
 
 
-def response(status_code, body):
-    """Generate API Gateway response."""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-User-Id,Authorization',
-            'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
-    }
+def get_answer(document_id, document_text, question):
+    """
+    Answer a question, reusing cached answers for the same document text.
+    
+    Returns:
+        Tuple of (result dict with answer and confidence, whether it was cached)
+    """
+    question_hash = _hash(question.lower().strip())
+    text_hash = _hash(document_text)
+    key = (document_id, question_hash, text_hash)
+    
+    if key in _local_cache:
+        _local_cache.move_to_end(key)
+        return _local_cache[key], True
+    
+    item = get_cached_answer(document_id, question_hash)
+    if item and item.get('textHash') == text_hash:
+        result = {'answer': item['answer'], 'confidence': item['confidence']}
+        cached = True
+    else:
+        result = answer_question(document_text, question)
+        put_cached_answer(
+            document_id, question_hash, text_hash,
+            result['answer'], result['confidence']
+        )
+        cached = False
+    
+    _local_cache[key] = result
+    if len(_local_cache) > LOCAL_CACHE_SIZE:
+        _local_cache.popitem(last=False)
+    
+    return result, cached
+
+
+def record_query(document_id, question, answer):
+    """Queue a Q&A interaction for the history consumer to persist."""
+    if not HISTORY_QUEUE_URL:
+        add_query_to_history(document_id, question, answer)
+        return
+
+    sqs.send_message(
+        QueueUrl=HISTORY_QUEUE_URL,
+        MessageBody=json.dumps({
+            'documentId': document_id,
+            'question': question,
+            'answer': answer,
+            'timestamp': now_iso()
+        })
+    )
+
+
+def _hash(value):
+    """Short content hash used for cache keys."""
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()
@@ -3,8 +3,13 @@ Document Summarization Lambda Handler
 
 Generates AI-powered summaries using Amazon Bedrock.
 """
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.bedrock import summarize_document, extract_key_entities, generate_document_questions
+from utils.dynamodb import get_document, store_analysis
+from utils.http import response
+from utils.storage import load_document_text
 
 BUCKET_NAME = os.environ.get('DOCUMENTS_BUCKET', 'documind-documents')
 
@@ -16,9 +21,6 @@ def lambda_handler(event, context):
     Expects documentId in path parameters.
     """
     try:
-        from utils.bedrock import summarize_document, extract_key_entities, generate_document_questions
-        from utils.dynamodb import get_document, store_summary, update_document_status
-        
         # Get document ID
         path_params = event.get('pathParameters', {}) or {}
         document_id = path_params.get('documentId')
@@ -39,27 +41,46 @@ def lambda_handler(event, context):
             return response(404, {'error': 'Document not found'})
         
         # Check if text has been extracted
-        extracted_text = document.get('extractedText')
-        
-        if not extracted_text:
+        if not (document.get('textS3Key') or document.get('extractedText')):
             return response(400, {
                 'error': 'Document text has not been extracted yet',
                 'hint': 'Call the extract endpoint first'
             })
         
-        # Check if we already have a summary (caching)
-        if document.get('summary') and not include_entities and not include_questions:
-            return response(200, {
+        # Check if we already have the requested analysis (caching)
+        if (
+            document.get('summary')
+            and (not include_entities or 'entities' in document)
+            and (not include_questions or 'suggestedQuestions' in document)
+        ):
+            result = {
                 'documentId': document_id,
                 'summary': document['summary'],
                 'cached': True
-            })
+            }
+            if include_entities:
+                result['entities'] = document['entities']
+            if include_questions:
+                result['suggestedQuestions'] = document['suggestedQuestions']
+            return response(200, result)
         
-        # Generate summary using Bedrock
-        summary = summarize_document(extracted_text, max_length)
+        extracted_text = load_document_text(document)
         
-        # Store summary
-        store_summary(document_id, summary)
+        # Generate summary, entities and questions with Bedrock in parallel
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            summary_future = executor.submit(summarize_document, extracted_text, max_length)
+            entities_future = (
+                executor.submit(extract_key_entities, extracted_text)
+                if include_entities else None
+            )
+            questions_future = (
+                executor.submit(generate_document_questions, extracted_text, num_questions=5)
+                if include_questions else None
+            )
+            
+            summary = summary_future.result()
+            entities = entities_future.result() if entities_future else None
+            questions = questions_future.result() if questions_future else None
         
         result = {
             'documentId': document_id,
@@ -67,33 +88,17 @@ def lambda_handler(event, context):
             'wordCount': document.get('wordCount', 0),
             'cached': False
         }
-        
-        # Optionally extract entities
         if include_entities:
-            entities = extract_key_entities(extracted_text)
             result['entities'] = entities
-        
-        # Optionally generate suggested questions
         if include_questions:
-            questions = generate_document_questions(extracted_text, num_questions=5)
             result['suggestedQuestions'] = questions
         
+        # Store everything in one write
+        store_analysis(document_id, summary=summary, entities=entities, questions=questions)
+        
         return response(200, result)
         
     except Exception as e:
         print(f"Error: {str(e)}")
         return response(500, {'error': 'Summarization failed', 'message': str(e)})
 
-
-def response(status_code, body):
-    """Generate API Gateway response."""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-User-Id,Authorization',
-            'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
-    }
@@ -4,16 +4,34 @@ Document Upload Lambda Handler
 Handles document uploads, generates presigned URLs, and creates document records.
 """
 import json
-import boto3
 import os
+import time
 import uuid
-from datetime import datetime
 
-s3 = boto3.client('s3')
+import fastjsonschema
+
+from utils.dynamodb import create_document
+from utils.s3_presign import get_presigner
+from utils.storage import upload_folder
+from utils.http import response
+from utils.auth import get_user_id
+
 BUCKET_NAME = os.environ.get('DOCUMENTS_BUCKET', 'documind-documents')
 ALLOWED_TYPES = ['application/pdf', 'image/png', 'image/jpeg', 'image/jpg', 'text/plain']
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
 
+validate_upload = fastjsonschema.compile({
+    'type': 'object',
+    'required': ['documentId', 's3Key', 'filename'],
+    'properties': {
+        'documentId': {'type': 'string', 'pattern': '^[A-Za-z0-9-]+$'},
+        's3Key': {'type': 'string', 'minLength': 1},
+        'filename': {'type': 'string', 'minLength': 1},
+        'contentType': {'type': 'string', 'default': 'application/pdf'},
+        'fileSize': {'type': 'integer', 'minimum': 0, 'default': 0}
+    }
+})
+
 
 def lambda_handler(event, context):
     """
@@ -39,15 +57,15 @@ def lambda_handler(event, context):
 
 
 def handle_get_presigned_url(event):
-    """Generate a presigned URL for uploading a document."""
+    """Generate a presigned browser POST for uploading a document."""
     params = event.get('queryStringParameters', {}) or {}
     
     filename = params.get('filename')
     content_type = params.get('contentType', 'application/pdf')
     user_id = get_user_id(event)
     
-    if not filename:
-        return response(400, {'error': 'filename is required'})
+    if not filename or '/' in filename:
+        return response(400, {'error': 'filename is required and cannot contain /'})
     
     if content_type not in ALLOWED_TYPES:
         return response(400, {
@@ -56,22 +74,20 @@ def handle_get_presigned_url(event):
     
     # Generate unique S3 key
     document_id = str(uuid.uuid4())
-    timestamp = datetime.utcnow().strftime('%Y/%m/%d')
+    timestamp = time.strftime('%Y/%m/%d', time.gmtime())
     s3_key = f"documents/{user_id}/{timestamp}/{document_id}/{filename}"
     
-    # Generate presigned URL for upload
-    presigned_url = s3.generate_presigned_url(
-        'put_object',
-        Params={
-            'Bucket': BUCKET_NAME,
-            'Key': s3_key,
-            'ContentType': content_type
-        },
-        ExpiresIn=3600  # 1 hour
+    # Generate presigned POST for upload; S3 enforces type and size
+    post = get_presigner(BUCKET_NAME).presigned_post(
+        s3_key,
+        content_type,
+        max_size=MAX_FILE_SIZE,
+        expires=3600  # 1 hour
     )
     
     return response(200, {
-        'uploadUrl': presigned_url,
+        'uploadUrl': post['url'],
+        'fields': post['fields'],
         'documentId': document_id,
         's3Key': s3_key,
         'expiresIn': 3600
@@ -81,69 +97,38 @@ def handle_get_presigned_url(event):
 def handle_upload_request(event):
     """Process document upload notification and create record."""
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = validate_upload(json.loads(event.get('body') or '{}'))
     except json.JSONDecodeError:
         return response(400, {'error': 'Invalid JSON body'})
+    except fastjsonschema.JsonSchemaException as e:
+        return response(400, {'error': e.message})
     
-    document_id = body.get('documentId')
-    s3_key = body.get('s3Key')
-    filename = body.get('filename')
-    content_type = body.get('contentType', 'application/pdf')
-    file_size = body.get('fileSize', 0)
+    document_id = body['documentId']
+    s3_key = body['s3Key']
+    filename = body['filename']
+    content_type = body['contentType']
+    # The integer schema type also accepts integral floats like 1.0
+    file_size = int(body['fileSize'])
     user_id = get_user_id(event)
     
-    if not all([document_id, s3_key, filename]):
-        return response(400, {
-            'error': 'documentId, s3Key, and filename are required'
-        })
-    
-    # Verify the file exists in S3
-    try:
-        s3.head_object(Bucket=BUCKET_NAME, Key=s3_key)
-    except s3.exceptions.ClientError:
-        return response(404, {'error': 'Document not found in S3'})
-    
-    # Import here to avoid cold start issues
-    from utils.dynamodb import create_document
+    # The key must be the one handed out for this user and document
+    if not upload_folder(s3_key, user_id, document_id):
+        return response(400, {'error': 's3Key does not match this user and documentId'})
     
-    # Create document record
+    # Create document record; the S3 upload event confirms the object exists
     document = create_document(
         user_id=user_id,
         filename=filename,
         s3_key=s3_key,
         content_type=content_type,
-        file_size=file_size
+        file_size=file_size,
+        document_id=document_id
     )
     
+    if document is None:
+        return response(409, {'error': 'documentId is already in use'})
+    
     return response(201, {
         'message': 'Document uploaded successfully',
         'document': document
     })
-
-
-def get_user_id(event):
-    """Extract user ID from request context or headers."""
-    # Try to get from Cognito authorizer
-    request_context = event.get('requestContext', {})
-    authorizer = request_context.get('authorizer', {})
-    
-    if 'claims' in authorizer:
-        return authorizer['claims'].get('sub', 'anonymous')
-    
-    # Fallback to header or anonymous
-    headers = event.get('headers', {}) or {}
-    return headers.get('X-User-Id', 'anonymous')
-
-
-def response(status_code, body):
-    """Generate API Gateway response."""
-    return {
-        'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-User-Id,Authorization',
-            'Access-Control-Allow-Methods': 'GET,POST,OPTIONS'
-        },
-        'body': json.dumps(body, default=str)
-    }
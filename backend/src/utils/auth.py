@@ -0,0 +1,18 @@
+"""
+Request identity helpers shared by the Lambda handlers.
+"""
+
+
+def get_user_id(event: dict) -> str:
+    """Extract user ID from request context or headers."""
+    # Try to get from Cognito authorizer
+    request_context = event.get('requestContext') or {}
+    authorizer = request_context.get('authorizer') or {}
+
+    claims = authorizer.get('claims')
+    if claims is not None:
+        return claims.get('sub', 'anonymous')
+
+    # Fallback to header or anonymous
+    headers = event.get('headers') or {}
+    return headers.get('X-User-Id', 'anonymous')
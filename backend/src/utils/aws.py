@@ -0,0 +1,46 @@
+"""
+Shared AWS client construction for the Lambda handlers.
+"""
+from boto3 import client as _client, resource as _resource
+from botocore.config import Config
+
+# Keep-alive connections survive across warm invocations
+CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 3},
+    connect_timeout=1.0,
+    read_timeout=60
+)
+
+
+def client(service_name: str, **kwargs):
+    """
+    Create a boto3 client with the shared connection config.
+
+    Create each client once per container (at import, or memoized on first
+    use) so the parsed service model and connection pool are reused across
+    warm invocations.
+
+    Args:
+        service_name: AWS service name, e.g. 's3'
+        **kwargs: Extra arguments for boto3.client (e.g. region_name)
+
+    Returns:
+        The boto3 client
+    """
+    return _client(service_name, config=CLIENT_CONFIG, **kwargs)
+
+
+def resource(service_name: str, **kwargs):
+    """
+    Create a boto3 resource with the shared connection config.
+
+    Args:
+        service_name: AWS service name, e.g. 'dynamodb'
+        **kwargs: Extra arguments for boto3.resource (e.g. region_name)
+
+    Returns:
+        The boto3 resource
+    """
+    return _resource(service_name, config=CLIENT_CONFIG, **kwargs)
@@ -1,23 +1,138 @@
 """
 Amazon Bedrock utility functions for LLM interactions.
 """
-import json
-import boto3
-from typing import Optional
+import re
+from typing import Iterator, List, Optional, Union
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.aws import client
+
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    _loads = json.loads
 
 # Initialize Bedrock client
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
+bedrock_runtime = client(
+    'bedrock-runtime',
     region_name=os.environ.get('AWS_REGION', 'us-east-1')
 )
 
 # Default model - Claude 3 Haiku (fast and cost-effective)
-DEFAULT_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+DEFAULT_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', "anthropic.claude-3-haiku-20240307-v1:0")
+
+# Model families that accept cache_control checkpoints on Bedrock
+_PROMPT_CACHE_MODELS = (
+    'anthropic.claude-3-5-haiku',
+    'anthropic.claude-3-7-sonnet',
+    'anthropic.claude-haiku-4',
+    'anthropic.claude-sonnet-4',
+    'anthropic.claude-opus-4'
+)
+PROMPT_CACHING = any(model in DEFAULT_MODEL_ID for model in _PROMPT_CACHE_MODELS)
+
+# Document tokens sent per call, leaving room in Haiku's 200k window
+MAX_DOCUMENT_TOKENS = 180000
+
+# Map-reduce summarization settings
+MAP_REDUCE_THRESHOLD = 8000  # characters
+MAP_WORKERS = 8
+REDUCE_GROUP_TOKENS = 20000  # section summaries condensed per call when they overflow
+
+CHUNK_PROMPT = """Summarize the following section of a larger document. 
+Keep the key points, names, figures and conclusions.
+
+Section:
+---
+{chunk}
+---
+
+Section summary:"""
+
+REDUCE_PROMPT = """The following are summaries of consecutive sections of one document. 
+Combine them into a single comprehensive summary of approximately {max_length} words 
+that captures the main points of the whole document.
+
+Section summaries:
+---
+{summaries}
+---
+
+Summary:"""
+
+# Hedging phrases used to grade answer confidence
+_LOW_CONFIDENCE_RE = re.compile(r"couldn't find|not found", re.IGNORECASE)
+_MEDIUM_CONFIDENCE_RE = re.compile(r"\b(?:may|might|possibly|appears)\b", re.IGNORECASE)
+
+# Document context given to generate_document_questions
+QUESTIONS_CONTEXT_CHARS = 3000
+
+# "1. question", "2) question", "- question", "* question", "• question"
+_QUESTION_RE = re.compile(r'^\s*(?:\d+[.)\]]|[-*•])\s+(.+?)\s*$')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+# Structured output schema for extract_key_entities
+ENTITIES_TOOL = {
+    "name": "record_entities",
+    "description": "Record the key entities found in a document.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "people": dict(_STRING_LIST, description="Person names"),
+            "organizations": dict(_STRING_LIST, description="Organization names"),
+            "dates": dict(_STRING_LIST, description="Dates mentioned"),
+            "locations": dict(_STRING_LIST, description="Locations"),
+            "monetary_values": dict(_STRING_LIST, description="Monetary amounts"),
+            "key_terms": dict(_STRING_LIST, description="Important terms or concepts")
+        },
+        "required": [
+            "people", "organizations", "dates",
+            "locations", "monetary_values", "key_terms"
+        ]
+    }
+}
+
+
+def _build_body(
+    prompt: Union[str, List[dict]],
+    system_prompt: Optional[str],
+    max_tokens: int,
+    temperature: float
+) -> dict:
+    """Build the Anthropic Messages request body from a prompt or content blocks."""
+    messages = [
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+    
+    body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "messages": messages
+    }
+    
+    if system_prompt:
+        body["system"] = system_prompt
+    
+    return body
 
 
 def invoke_claude(
-    prompt: str,
+    prompt: Union[str, List[dict]],
     system_prompt: Optional[str] = None,
     max_tokens: int = 4096,
     temperature: float = 0.7,
@@ -27,7 +142,7 @@ def invoke_claude(
     Invoke Claude model via Amazon Bedrock.
     
     Args:
-        prompt: The user prompt to send to the model
+        prompt: The user prompt, or a list of content blocks, to send to the model
         system_prompt: Optional system prompt for context
         max_tokens: Maximum tokens in response
         temperature: Creativity parameter (0-1)
@@ -36,38 +151,103 @@ def invoke_claude(
     Returns:
         The model's response text
     """
-    messages = [
-        {
-            "role": "user",
-            "content": prompt
-        }
-    ]
+    body = _build_body(prompt, system_prompt, max_tokens, temperature)
     
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-        "messages": messages
-    }
+    response_body = _invoke_model(body, model_id)
+    return response_body['content'][0]['text']
+
+
+def invoke_claude_tool(
+    prompt: Union[str, List[dict]],
+    tool: dict,
+    system_prompt: Optional[str] = None,
+    max_tokens: int = 4096,
+    temperature: float = 0.7,
+    model_id: str = DEFAULT_MODEL_ID
+) -> dict:
+    """
+    Invoke Claude and force it to answer by calling a single tool.
     
-    if system_prompt:
-        body["system"] = system_prompt
+    Args:
+        prompt: The user prompt, or a list of content blocks, to send to the model
+        tool: Tool definition with name, description and input_schema
+        system_prompt: Optional system prompt for context
+        max_tokens: Maximum tokens in response
+        temperature: Creativity parameter (0-1)
+        model_id: The Bedrock model ID to use
+        
+    Returns:
+        The tool input produced by the model, matching the tool's input_schema
+    """
+    body = _build_body(prompt, system_prompt, max_tokens, temperature)
+    body["tools"] = [tool]
+    body["tool_choice"] = {"type": "tool", "name": tool["name"]}
+    
+    response_body = _invoke_model(body, model_id)
+    for block in response_body['content']:
+        if block['type'] == 'tool_use':
+            return block['input']
     
+    raise ValueError(f"Model did not call tool {tool['name']}")
+
+
+def _invoke_model(body: dict, model_id: str) -> dict:
+    """Send a request body to Bedrock and return the parsed response."""
     response = bedrock_runtime.invoke_model(
         modelId=model_id,
         contentType="application/json",
         accept="application/json",
-        body=json.dumps(body)
+        body=_dumps(body)
     )
     
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+    return _loads(response['body'].read())
+
+
+def invoke_claude_stream(
+    prompt: Union[str, List[dict]],
+    system_prompt: Optional[str] = None,
+    max_tokens: int = 4096,
+    temperature: float = 0.7,
+    model_id: str = DEFAULT_MODEL_ID
+) -> Iterator[str]:
+    """
+    Invoke Claude via Amazon Bedrock and yield text as it is generated.
+    
+    Args:
+        prompt: The user prompt, or a list of content blocks, to send to the model
+        system_prompt: Optional system prompt for context
+        max_tokens: Maximum tokens in response
+        temperature: Creativity parameter (0-1)
+        model_id: The Bedrock model ID to use
+        
+    Yields:
+        Text fragments of the model's response
+    """
+    body = _build_body(prompt, system_prompt, max_tokens, temperature)
+    
+    response = bedrock_runtime.invoke_model_with_response_stream(
+        modelId=model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=_dumps(body)
+    )
+    
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        payload = _loads(chunk['bytes'])
+        if payload.get('type') == 'content_block_delta':
+            yield payload['delta'].get('text', '')
 
 
 def summarize_document(text: str, max_length: int = 500) -> str:
     """
     Generate a summary of the given document text.
     
+    Long documents are summarized map-reduce style: each chunk is summarized
+    in parallel, then the partial summaries are combined into one.
+    
     Args:
         text: The document text to summarize
         max_length: Approximate maximum length of summary
@@ -80,17 +260,43 @@ def summarize_document(text: str, max_length: int = 500) -> str:
     main ideas, and important details. Be objective and maintain the original 
     meaning."""
     
-    prompt = f"""Please provide a comprehensive summary of the following document. 
+    def summarize_chunks(chunks: List[str]) -> str:
+        with ThreadPoolExecutor(max_workers=MAP_WORKERS) as executor:
+            partials = executor.map(
+                lambda chunk: invoke_claude(
+                    CHUNK_PROMPT.format(chunk=chunk),
+                    system_prompt=system_prompt,
+                    max_tokens=1024,
+                    temperature=0.3
+                ),
+                chunks
+            )
+            return '\n\n'.join(partials)
+    
+    if len(text) > MAP_REDUCE_THRESHOLD:
+        summaries = summarize_chunks(_chunk(text))
+        
+        # Too many sections for one reduce call: summarize the summaries in groups
+        while len(summaries.encode('utf-8')) > MAX_DOCUMENT_TOKENS * 4:
+            summaries = summarize_chunks(_chunk(summaries, REDUCE_GROUP_TOKENS))
+        
+        prompt = REDUCE_PROMPT.format(
+            max_length=max_length,
+            summaries=summaries
+        )
+    else:
+        prompt = [
+            _document_block(text),
+            {
+                "type": "text",
+                "text": f"""Please provide a comprehensive summary of the document above. 
 The summary should be approximately {max_length} words and capture the main points.
 
-Document:
----
-{text}
----
-
 Summary:"""
+            }
+        ]
     
-    return invoke_claude(prompt, system_prompt=system_prompt, temperature=0.3)
+    return ''.join(invoke_claude_stream(prompt, system_prompt=system_prompt, temperature=0.3))
 
 
 def answer_question(document_text: str, question: str) -> dict:
@@ -109,26 +315,28 @@ def answer_question(document_text: str, question: str) -> dict:
     in the document, say so clearly. Always cite relevant parts of the document 
     when possible."""
     
-    prompt = f"""Based on the following document, please answer the question.
+    prompt = [
+        _document_block(document_text),
+        {
+            "type": "text",
+            "text": f"""Based on the document above, please answer the question.
 If the answer is not found in the document, respond with "I couldn't find this information in the document."
 
-Document:
----
-{document_text}
----
-
 Question: {question}
 
 Please provide a clear and concise answer:"""
+        }
+    ]
     
-    answer = invoke_claude(prompt, system_prompt=system_prompt, temperature=0.2)
+    answer = ''.join(invoke_claude_stream(prompt, system_prompt=system_prompt, temperature=0.2))
     
     # Determine confidence based on response
-    confidence = "high"
-    if "couldn't find" in answer.lower() or "not found" in answer.lower():
+    if _LOW_CONFIDENCE_RE.search(answer):
         confidence = "low"
-    elif "may" in answer.lower() or "might" in answer.lower():
+    elif _MEDIUM_CONFIDENCE_RE.search(answer):
         confidence = "medium"
+    else:
+        confidence = "high"
     
     return {
         "answer": answer,
@@ -149,37 +357,18 @@ def extract_key_entities(text: str) -> dict:
     system_prompt = """You are an entity extraction expert. Extract key entities 
     from documents accurately. Return entities in a structured format."""
     
-    prompt = f"""Extract key entities from the following document. 
+    prompt = [
+        _document_block(text),
+        {
+            "type": "text",
+            "text": """Extract key entities from the document above. 
 Identify: People, Organizations, Dates, Locations, Monetary Values, and Key Terms.
 
-Document:
----
-{text}
----
-
-Return the entities as a JSON object with these keys:
-- people: list of person names
-- organizations: list of organization names
-- dates: list of dates mentioned
-- locations: list of locations
-- monetary_values: list of monetary amounts
-- key_terms: list of important terms or concepts
-
-JSON:"""
-    
-    response = invoke_claude(prompt, system_prompt=system_prompt, temperature=0.1)
-    
-    # Try to parse as JSON, fallback to returning raw response
-    try:
-        # Find JSON in response
-        start = response.find('{')
-        end = response.rfind('}') + 1
-        if start != -1 and end > start:
-            return json.loads(response[start:end])
-    except json.JSONDecodeError:
-        pass
+Record the entities with the record_entities tool."""
+        }
+    ]
     
-    return {"raw_response": response}
+    return invoke_claude_tool(prompt, ENTITIES_TOOL, system_prompt=system_prompt, temperature=0.1)
 
 
 def generate_document_questions(text: str, num_questions: int = 5) -> list:
@@ -202,21 +391,97 @@ Focus on important details, key concepts, and practical insights.
 
 Document:
 ---
-{text[:3000]}  # Limit text to avoid token limits
+{_sentence_prefix(text, QUESTIONS_CONTEXT_CHARS)}
 ---
 
 Generate exactly {num_questions} questions, one per line, numbered 1-{num_questions}:"""
     
     response = invoke_claude(prompt, system_prompt=system_prompt, temperature=0.7)
     
-    # Parse questions from response
+    # Parse numbered or bulleted questions from response
     questions = []
-    for line in response.strip().split('\n'):
-        line = line.strip()
-        if line and (line[0].isdigit() or line.startswith('-')):
-            # Remove numbering/bullets
-            question = line.lstrip('0123456789.-) ').strip()
-            if question:
-                questions.append(question)
-    
-    return questions[:num_questions]
+    for line in response.splitlines():
+        match = _QUESTION_RE.match(line)
+        if match:
+            questions.append(match.group(1))
+            if len(questions) == num_questions:
+                break
+    
+    return questions
+
+
+def _document_block(text: str) -> dict:
+    """
+    Build the document content block shared by every prompt about a document.
+    
+    The document goes first so that, on models that support it, repeat calls
+    for the same document reuse the cached prefix.
+    """
+    block = {"type": "text", "text": f"Document:\n---\n{_fit(text)}\n---"}
+    if PROMPT_CACHING:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+
+def _fit(text: str, max_tokens: int = MAX_DOCUMENT_TOKENS) -> str:
+    """
+    Truncate text to roughly max_tokens tokens, keeping its head and tail.
+    
+    Uses ~4 UTF-8 bytes per token as the estimate, so the cut is cheap and
+    deterministic (the truncated text stays a stable prompt-cache prefix).
+    """
+    budget = max_tokens * 4
+    data = text.encode('utf-8')
+    if len(data) <= budget:
+        return text
+    
+    half = budget // 2
+    head = data[:half].decode('utf-8', 'ignore')
+    tail = data[-half:].decode('utf-8', 'ignore')
+    return f"{head}\n...\n{tail}"
+
+
+def _sentence_prefix(text: str, max_chars: int) -> str:
+    """Return at most max_chars of text, cut at the last sentence boundary."""
+    if len(text) <= max_chars:
+        return text
+    
+    window = text[:max_chars]
+    cut = None
+    for match in _SENTENCE_END_RE.finditer(window):
+        cut = match.start()
+    
+    return window[:cut] if cut else window
+
+
+def _chunk(text: str, target_tokens: int = 2000) -> List[str]:
+    """
+    Split text into chunks of roughly target_tokens tokens on line boundaries.
+    
+    Uses ~4 characters per token as the estimate. Lines longer than a whole
+    chunk are split mid-line.
+    """
+    budget = target_tokens * 4
+    chunks = []
+    current = []
+    size = 0
+    
+    for line in text.split('\n'):
+        while len(line) > budget:
+            if current:
+                chunks.append('\n'.join(current))
+                current, size = [], 0
+            chunks.append(line[:budget])
+            line = line[budget:]
+        
+        if current and size + len(line) > budget:
+            chunks.append('\n'.join(current))
+            current, size = [], 0
+        
+        current.append(line)
+        size += len(line) + 1
+    
+    if current:
+        chunks.append('\n'.join(current))
+    
+    return chunks
@@ -1,24 +1,54 @@
 """
 DynamoDB utility functions for document metadata storage.
 """
-import boto3
 import os
-from datetime import datetime
-from typing import Optional, List
+from datetime import datetime, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Optional, List, Tuple
+import time
 import uuid
 
-# Initialize DynamoDB resource
-dynamodb = boto3.resource(
-    'dynamodb',
-    region_name=os.environ.get('AWS_REGION', 'us-east-1')
-)
+from utils.aws import resource
+from utils.storage import delete_object, put_document_text
 
 TABLE_NAME = os.environ.get('DOCUMENTS_TABLE', 'DocuMindDocuments')
+ANSWER_CACHE_TABLE_NAME = os.environ.get('ANSWER_CACHE_TABLE', 'DocuMindAnswerCache')
 
+# Attributes returned for the document list view
+LIST_PROJECTION = 'documentId, filename, fileSize, #status, createdAt, wordCount, summary'
 
+# Attributes update_document_status sets itself (or that can't be updated)
+_STATUS_UPDATE_ATTRIBUTES = frozenset({'documentId', 'status', 'updatedAt'})
+
+# Attributes create_document keeps if the upload's S3 event already set them
+_CREATE_KEEP_ATTRIBUTES = frozenset({'status', 'createdAt', 'queryHistory'})
+
+
+def now_iso() -> str:
+    """Current UTC time as a fixed-width ISO 8601 timestamp."""
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+
+@lru_cache(maxsize=1)
+def get_dynamodb():
+    """Get the DynamoDB resource, created on first use."""
+    return resource(
+        'dynamodb',
+        region_name=os.environ.get('AWS_REGION', 'us-east-1')
+    )
+
+
+@lru_cache(maxsize=1)
 def get_table():
     """Get the DynamoDB table resource."""
-    return dynamodb.Table(TABLE_NAME)
+    return get_dynamodb().Table(TABLE_NAME)
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache_table():
+    """Get the DynamoDB answer cache table resource."""
+    return get_dynamodb().Table(ANSWER_CACHE_TABLE_NAME)
 
 
 def create_document(
@@ -26,78 +56,162 @@ def create_document(
     filename: str,
     s3_key: str,
     content_type: str,
-    file_size: int
-) -> dict:
+    file_size: int,
+    document_id: Optional[str] = None
+) -> Optional[dict]:
     """
     Create a new document record in DynamoDB.
     
+    The upload's S3 event may already have created the record and advanced
+    its status, so status, createdAt and extraction fields are kept if set.
+    
     Args:
         user_id: The user who uploaded the document
         filename: Original filename
         s3_key: S3 object key
         content_type: MIME type of the document
         file_size: File size in bytes
+        document_id: Document ID embedded in the S3 key (generated if omitted)
         
     Returns:
-        The created document record
+        The document record, or None if the ID belongs to another user
     """
     table = get_table()
     
-    document_id = str(uuid.uuid4())
-    timestamp = datetime.utcnow().isoformat()
+    item = _build_item(user_id, filename, s3_key, content_type, file_size)
+    if document_id:
+        item['documentId'] = document_id
+    key = {'documentId': item.pop('documentId')}
     
-    item = {
-        'documentId': document_id,
+    assignments = []
+    expression_names = {'#owner': 'userId'}
+    expression_values = {':owner': user_id}
+    for i, (name, value) in enumerate(item.items()):
+        expression_names[f'#a{i}'] = name
+        expression_values[f':a{i}'] = value
+        if name in _CREATE_KEEP_ATTRIBUTES:
+            assignments.append(f"#a{i} = if_not_exists(#a{i}, :a{i})")
+        else:
+            assignments.append(f"#a{i} = :a{i}")
+    
+    try:
+        response = table.update_item(
+            Key=key,
+            UpdateExpression="SET " + ", ".join(assignments),
+            ConditionExpression='attribute_not_exists(#owner) OR #owner = :owner',
+            ExpressionAttributeNames=expression_names,
+            ExpressionAttributeValues=expression_values,
+            ReturnValues='ALL_NEW'
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return None
+    
+    return response['Attributes']
+
+
+def create_documents_bulk(records: List[dict]) -> List[dict]:
+    """
+    Create many document records with batched writes.
+    
+    Args:
+        records: Dicts with the create_document arguments (user_id, filename,
+            s3_key, content_type, file_size)
+        
+    Returns:
+        The created document records
+    """
+    table = get_table()
+    
+    # Every item gets a fresh ID, so these unconditional puts can't
+    # overwrite an existing record
+    items = [_build_item(**record) for record in records]
+    
+    # batch_writer sends 25 items per request and retries unprocessed items
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    
+    return items
+
+
+def _build_item(
+    user_id: str,
+    filename: str,
+    s3_key: str,
+    content_type: str,
+    file_size: int
+) -> dict:
+    """Build a new document record with a freshly generated ID."""
+    timestamp = now_iso()
+    
+    return {
+        'documentId': str(uuid.uuid4()),
         'userId': user_id,
         'filename': filename,
         's3Key': s3_key,
         'contentType': content_type,
         'fileSize': file_size,
         'status': 'UPLOADED',
+        'queryHistory': [],
         'createdAt': timestamp,
         'updatedAt': timestamp
     }
-    
-    table.put_item(Item=item)
-    
-    return item
 
 
-def update_document_status(document_id: str, status: str, metadata: Optional[dict] = None) -> dict:
+def update_document_status(
+    document_id: str,
+    status: str,
+    metadata: Optional[dict] = None,
+    must_exist: bool = False
+) -> Optional[dict]:
     """
     Update document status and optionally add metadata.
     
     Args:
         document_id: The document ID
-        status: New status (UPLOADED, PROCESSING, EXTRACTED, COMPLETED, FAILED)
-        metadata: Additional metadata to store
+        status: New status (UPLOADED, PROCESSING, EXTRACTING, EXTRACTED, COMPLETED, FAILED)
+        metadata: Additional attributes to store, keyed by attribute name
+        must_exist: Only update an existing record instead of creating one
         
     Returns:
-        Updated document record
+        Updated document record, or None if must_exist is set and the
+        document doesn't exist
     """
     table = get_table()
     
-    update_expression = "SET #status = :status, updatedAt = :updatedAt"
+    assignments = ["#status = :status", "updatedAt = :updatedAt"]
     expression_values = {
         ':status': status,
-        ':updatedAt': datetime.utcnow().isoformat()
+        ':updatedAt': now_iso()
     }
     expression_names = {
         '#status': 'status'
     }
     
     if metadata:
-        for key, value in metadata.items():
-            update_expression += f", {key} = :{key}"
-            expression_values[f':{key}'] = value
-    
-    response = table.update_item(
-        Key={'documentId': document_id},
-        UpdateExpression=update_expression,
-        ExpressionAttributeNames=expression_names,
-        ExpressionAttributeValues=expression_values,
-        ReturnValues='ALL_NEW'
-    )
+        reserved = _STATUS_UPDATE_ATTRIBUTES.intersection(metadata)
+        if reserved:
+            raise ValueError(f"metadata cannot set {', '.join(sorted(reserved))}")
+        
+        # Placeholders keep reserved words (e.g. "size") and odd names valid
+        for i, (key, value) in enumerate(metadata.items()):
+            assignments.append(f"#m{i} = :m{i}")
+            expression_names[f'#m{i}'] = key
+            expression_values[f':m{i}'] = value
+    
+    condition = {'ConditionExpression': 'attribute_exists(documentId)'} if must_exist else {}
+    
+    try:
+        response = table.update_item(
+            Key={'documentId': document_id},
+            UpdateExpression="SET " + ", ".join(assignments),
+            ExpressionAttributeNames=expression_names,
+            ExpressionAttributeValues=expression_values,
+            ReturnValues='ALL_NEW',
+            **condition
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return None
     
     return response.get('Attributes', {})
 
@@ -119,28 +233,44 @@ def get_document(document_id: str) -> Optional[dict]:
     return response.get('Item')
 
 
-def get_user_documents(user_id: str, limit: int = 50) -> List[dict]:
+def get_user_documents(
+    user_id: str,
+    limit: int = 50,
+    start_key: Optional[dict] = None,
+    projection: Optional[str] = LIST_PROJECTION
+) -> Tuple[List[dict], Optional[dict]]:
     """
-    Get all documents for a user.
+    Get a page of documents for a user.
     
     Args:
         user_id: The user ID
         limit: Maximum number of documents to return
+        start_key: LastEvaluatedKey from the previous page
+        projection: ProjectionExpression to read (defaults to the list-view
+            attributes, None for whole items); may use #status for status
         
     Returns:
-        List of document records
+        Tuple of (document records, LastEvaluatedKey or None on the last page)
     """
     table = get_table()
     
-    response = table.query(
-        IndexName='userId-createdAt-index',
-        KeyConditionExpression='userId = :userId',
-        ExpressionAttributeValues={':userId': user_id},
-        ScanIndexForward=False,  # Most recent first
-        Limit=limit
-    )
+    query_args = {
+        'IndexName': 'userId-createdAt-index',
+        'KeyConditionExpression': 'userId = :userId',
+        'ExpressionAttributeValues': {':userId': user_id},
+        'ScanIndexForward': False,  # Most recent first
+        'Limit': limit
+    }
+    if projection:
+        query_args['ProjectionExpression'] = projection
+        if '#status' in projection:
+            query_args['ExpressionAttributeNames'] = {'#status': 'status'}
+    if start_key:
+        query_args['ExclusiveStartKey'] = start_key
+    
+    response = table.query(**query_args)
     
-    return response.get('Items', [])
+    return response.get('Items', []), response.get('LastEvaluatedKey')
 
 
 def delete_document(document_id: str) -> bool:
@@ -162,10 +292,12 @@ def delete_document(document_id: str) -> bool:
         return False
 
 
-def store_extracted_text(document_id: str, text: str, word_count: int, confidence: float) -> dict:
+def store_extracted_text(document_id: str, text: str, word_count: int, confidence: float) -> Optional[dict]:
     """
     Store extracted text for a document.
     
+    The text itself goes to S3; the record keeps its key and metadata.
+    
     Args:
         document_id: The document ID
         text: Extracted text content
@@ -173,18 +305,27 @@ def store_extracted_text(document_id: str, text: str, word_count: int, confidenc
         confidence: OCR confidence score
         
     Returns:
-        Updated document record
+        Updated document record, or None if the document was deleted
     """
-    return update_document_status(
+    text_key = put_document_text(document_id, text)
+    
+    document = update_document_status(
         document_id,
         'EXTRACTED',
         {
-            'extractedText': text[:50000],  # Limit text size for DynamoDB
+            'textS3Key': text_key,
             'wordCount': word_count,
-            'ocrConfidence': str(confidence),  # DynamoDB doesn't support float
+            'ocrConfidence': Decimal(str(round(confidence, 4))),  # DynamoDB numbers must be Decimal
             'textLength': len(text)
-        }
+        },
+        must_exist=True
     )
+    
+    if document is None:
+        # Deleted while extracting; don't leave its text behind
+        delete_object(text_key)
+    
+    return document
 
 
 def store_summary(document_id: str, summary: str) -> dict:
@@ -198,10 +339,40 @@ def store_summary(document_id: str, summary: str) -> dict:
     Returns:
         Updated document record
     """
+    return store_analysis(document_id, summary=summary)
+
+
+def store_analysis(
+    document_id: str,
+    *,
+    summary: Optional[str] = None,
+    entities: Optional[dict] = None,
+    questions: Optional[List[str]] = None
+) -> dict:
+    """
+    Store AI-generated analysis for a document in a single write.
+    
+    Only the provided fields are written; the document is marked COMPLETED.
+    
+    Args:
+        document_id: The document ID
+        summary: The generated summary
+        entities: Extracted key entities
+        questions: Suggested questions
+        
+    Returns:
+        Updated document record
+    """
+    fields = {
+        'summary': summary,
+        'entities': entities,
+        'suggestedQuestions': questions
+    }
+    
     return update_document_status(
         document_id,
         'COMPLETED',
-        {'summary': summary}
+        {key: value for key, value in fields.items() if value is not None}
     )
 
 
@@ -214,31 +385,90 @@ def add_query_to_history(document_id: str, question: str, answer: str) -> None:
         question: The user's question
         answer: The AI's answer
     """
-    table = get_table()
-    
-    timestamp = datetime.utcnow().isoformat()
-    query_item = {
+    add_queries_to_history(document_id, [{
         'question': question,
         'answer': answer,
-        'timestamp': timestamp
-    }
+        'timestamp': now_iso()
+    }])
+
+
+def add_queries_to_history(document_id: str, query_items: List[dict]) -> bool:
+    """
+    Append several Q&A interactions to document history in one write.
     
-    # Append to query history list
+    Args:
+        document_id: The document ID
+        query_items: Dicts with question, answer and timestamp, oldest first
+        
+    Returns:
+        False if the document no longer exists, True otherwise
+    """
+    table = get_table()
+    
+    # Append to query history list; if_not_exists covers pre-existing records.
+    # The condition stops a queued append from recreating a deleted document.
     try:
         table.update_item(
             Key={'documentId': document_id},
             UpdateExpression="SET queryHistory = list_append(if_not_exists(queryHistory, :empty), :query)",
+            ConditionExpression='attribute_exists(documentId)',
             ExpressionAttributeValues={
-                ':query': [query_item],
+                ':query': query_items,
                 ':empty': []
             }
         )
-    except Exception:
-        # If list_append fails, create new list
-        table.update_item(
-            Key={'documentId': document_id},
-            UpdateExpression="SET queryHistory = :query",
-            ExpressionAttributeValues={
-                ':query': [query_item]
-            }
-        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    
+    return True
+
+
+def get_cached_answer(document_id: str, question_hash: str) -> Optional[dict]:
+    """
+    Get a cached answer for a question about a document.
+    
+    Args:
+        document_id: The document ID
+        question_hash: Hash of the normalized question
+        
+    Returns:
+        Cache item or None if not found
+    """
+    table = get_answer_cache_table()
+    
+    response = table.get_item(
+        Key={'documentId': document_id, 'questionHash': question_hash}
+    )
+    
+    return response.get('Item')
+
+
+def put_cached_answer(
+    document_id: str,
+    question_hash: str,
+    text_hash: str,
+    answer: str,
+    confidence: str,
+    ttl_seconds: int = 86400 * 30
+) -> None:
+    """
+    Cache an answer for a question about a document.
+    
+    Args:
+        document_id: The document ID
+        question_hash: Hash of the normalized question
+        text_hash: Hash of the document text the answer was generated from
+        answer: The AI's answer
+        confidence: The answer's confidence level
+        ttl_seconds: How long DynamoDB keeps the item before expiring it
+    """
+    table = get_answer_cache_table()
+    
+    table.put_item(Item={
+        'documentId': document_id,
+        'questionHash': question_hash,
+        'textHash': text_hash,
+        'answer': answer,
+        'confidence': confidence,
+        'ttl': int(time.time()) + ttl_seconds
+    })
@@ -0,0 +1,38 @@
+"""
+API Gateway response helpers shared by the Lambda handlers.
+"""
+import json
+from decimal import Decimal
+
+
+def _default(obj):
+    # DynamoDB returns numbers as Decimal
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    return str(obj)
+
+
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=_default).decode()
+except ImportError:
+    def _dumps(obj) -> str:
+        return json.dumps(obj, default=_default)
+
+_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-User-Id,Authorization',
+    'Access-Control-Allow-Methods': 'GET,POST,DELETE,OPTIONS'
+}
+
+
+def response(status_code: int, body) -> dict:
+    """Generate API Gateway response."""
+    return {
+        'statusCode': status_code,
+        'headers': _HEADERS,
+        'body': _dumps(body)
+    }
@@ -0,0 +1,193 @@
+"""
+Local AWS SigV4 presigner for S3 URLs.
+
+Signs GET/PUT URLs and browser POST policies for a single bucket without
+going through botocore's endpoint resolver and event system on every request.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import quote
+
+import botocore.session
+
+_ALGORITHM = 'AWS4-HMAC-SHA256'
+_SERVICE = 's3'
+_UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+
+
+@lru_cache(maxsize=8)
+def _signing_key(secret_key: str, date: str, region: str) -> bytes:
+    """Derive the SigV4 signing key (changes once per day)."""
+    k_date = hmac.new(f'AWS4{secret_key}'.encode(), date.encode(), hashlib.sha256).digest()
+    k_region = hmac.new(k_date, region.encode(), hashlib.sha256).digest()
+    k_service = hmac.new(k_region, _SERVICE.encode(), hashlib.sha256).digest()
+    return hmac.new(k_service, b'aws4_request', hashlib.sha256).digest()
+
+
+class FastPresigner:
+    """Generate presigned S3 URLs for one bucket."""
+
+    def __init__(
+        self,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        session_token: Optional[str] = None
+    ):
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.host = f'{bucket}.s3.{region}.amazonaws.com'
+
+    @classmethod
+    def from_environment(cls, bucket: str, region: Optional[str] = None) -> 'FastPresigner':
+        """Create a presigner from the default botocore credential chain."""
+        credentials = botocore.session.Session().get_credentials()
+        if credentials is None:
+            raise RuntimeError('No AWS credentials found for signing S3 URLs')
+        credentials = credentials.get_frozen_credentials()
+        return cls(
+            bucket=bucket,
+            region=region or os.environ.get('AWS_REGION', 'us-east-1'),
+            access_key=credentials.access_key,
+            secret_key=credentials.secret_key,
+            session_token=credentials.token
+        )
+
+    def presigned_get(self, key: str, expires: int = 3600) -> str:
+        """
+        Generate a presigned URL for downloading an object.
+
+        Args:
+            key: S3 object key
+            expires: URL lifetime in seconds
+
+        Returns:
+            The presigned URL
+        """
+        return self._presign('GET', key, expires, {})
+
+    def presigned_put(self, key: str, content_type: str, expires: int = 3600) -> str:
+        """
+        Generate a presigned URL for uploading an object.
+
+        Args:
+            key: S3 object key
+            content_type: Content-Type the client must send with the upload
+            expires: URL lifetime in seconds
+
+        Returns:
+            The presigned URL
+        """
+        return self._presign('PUT', key, expires, {'content-type': content_type})
+
+    def presigned_post(
+        self,
+        key: str,
+        content_type: str,
+        max_size: int,
+        expires: int = 3600
+    ) -> dict:
+        """
+        Generate a presigned browser POST for uploading an object.
+
+        The policy pins the key and Content-Type and limits the upload size,
+        so S3 enforces them without a round-trip to us.
+
+        Args:
+            key: S3 object key
+            content_type: Content-Type the upload must declare
+            max_size: Maximum upload size in bytes
+            expires: Policy lifetime in seconds
+
+        Returns:
+            Dictionary with the form 'url' and the 'fields' to post with the file
+        """
+        now = time.time()
+        amz_date = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(now))
+        date = amz_date[:8]
+
+        fields = {
+            'key': key,
+            'Content-Type': content_type,
+            'x-amz-algorithm': _ALGORITHM,
+            'x-amz-credential': f'{self.access_key}/{date}/{self.region}/{_SERVICE}/aws4_request',
+            'x-amz-date': amz_date
+        }
+        if self.session_token:
+            fields['x-amz-security-token'] = self.session_token
+
+        conditions = [{'bucket': self.bucket}]
+        conditions.extend({name: value} for name, value in fields.items())
+        conditions.append(['content-length-range', 1, max_size])
+
+        policy = {
+            'expiration': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now + expires)),
+            'conditions': conditions
+        }
+        encoded_policy = base64.b64encode(json.dumps(policy).encode()).decode()
+
+        fields['policy'] = encoded_policy
+        fields['x-amz-signature'] = hmac.new(
+            _signing_key(self.secret_key, date, self.region),
+            encoded_policy.encode(),
+            hashlib.sha256
+        ).hexdigest()
+
+        return {'url': f'https://{self.host}/', 'fields': fields}
+
+    def _presign(self, method: str, key: str, expires: int, headers: dict) -> str:
+        amz_date = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        date = amz_date[:8]
+        scope = f'{date}/{self.region}/{_SERVICE}/aws4_request'
+
+        headers = dict(headers, host=self.host)
+        signed_headers = ';'.join(sorted(headers))
+        canonical_headers = ''.join(f'{name}:{headers[name]}\n' for name in sorted(headers))
+
+        params = {
+            'X-Amz-Algorithm': _ALGORITHM,
+            'X-Amz-Credential': f'{self.access_key}/{scope}',
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires),
+            'X-Amz-SignedHeaders': signed_headers
+        }
+        if self.session_token:
+            params['X-Amz-Security-Token'] = self.session_token
+
+        query = '&'.join(
+            f"{name}={quote(params[name], safe='-_.~')}" for name in sorted(params)
+        )
+        path = '/' + quote(key, safe='/~')
+
+        canonical_request = '\n'.join([
+            method, path, query, canonical_headers, signed_headers, _UNSIGNED_PAYLOAD
+        ])
+        string_to_sign = '\n'.join([
+            _ALGORITHM,
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        signature = hmac.new(
+            _signing_key(self.secret_key, date, self.region),
+            string_to_sign.encode(),
+            hashlib.sha256
+        ).hexdigest()
+
+        return f'https://{self.host}{path}?{query}&X-Amz-Signature={signature}'
+
+
+@lru_cache(maxsize=4)
+def get_presigner(bucket: str) -> FastPresigner:
+    """Get the presigner for a bucket, created on first use."""
+    return FastPresigner.from_environment(bucket)
@@ -0,0 +1,112 @@
+"""
+S3 utility functions for derived document artifacts.
+"""
+import gzip
+import os
+import re
+from typing import Optional
+
+from utils.aws import client
+
+s3 = client('s3')
+BUCKET_NAME = os.environ.get('DOCUMENTS_BUCKET', 'documind-documents')
+
+# Derived artifacts live outside documents/ so they don't trigger extraction
+DERIVED_PREFIX = 'derived/{document_id}/'
+
+
+def upload_folder(s3_key: str, user_id: str, document_id: str) -> Optional[str]:
+    """
+    Check that s3_key is an upload key for the given user and document.
+
+    Uploads live at documents/{userId}/{yyyy}/{mm}/{dd}/{documentId}/{filename}.
+
+    Args:
+        s3_key: S3 object key to check
+        user_id: The user the upload must belong to
+        document_id: The document the upload must belong to
+
+    Returns:
+        The document's upload folder (ending in '/'), or None if the key
+        does not match
+    """
+    match = re.fullmatch(
+        rf'(documents/{re.escape(user_id)}/\d{{4}}/\d{{2}}/\d{{2}}/{re.escape(document_id)}/)[^/]+',
+        s3_key
+    )
+    return match.group(1) if match else None
+
+
+def derived_prefix(document_id: str) -> str:
+    """Get the S3 prefix holding a document's derived artifacts."""
+    return DERIVED_PREFIX.format(document_id=document_id)
+
+
+def get_object_bytes(key: str) -> bytes:
+    """
+    Read an object from the documents bucket.
+
+    Args:
+        key: S3 object key
+
+    Returns:
+        The object content
+    """
+    response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    return response['Body'].read()
+
+
+def put_document_text(document_id: str, text: str) -> str:
+    """
+    Store extracted text for a document in S3, gzip-compressed.
+
+    Args:
+        document_id: The document ID
+        text: Extracted text content
+
+    Returns:
+        The S3 key the text was written to
+    """
+    key = derived_prefix(document_id) + 'text.txt.gz'
+
+    s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=gzip.compress(text.encode('utf-8'), compresslevel=6),
+        ContentType='text/plain; charset=utf-8',
+        ContentEncoding='gzip'
+    )
+
+    return key
+
+
+def delete_object(key: str) -> None:
+    """
+    Delete an object from the documents bucket.
+
+    Args:
+        key: S3 object key
+    """
+    s3.delete_object(Bucket=BUCKET_NAME, Key=key)
+
+
+def load_document_text(document: dict) -> Optional[str]:
+    """
+    Load the extracted text for a document record.
+
+    Args:
+        document: The document record
+
+    Returns:
+        The extracted text, or None if it has not been extracted yet
+    """
+    key = document.get('textS3Key')
+    if not key:
+        # Records extracted before text moved to S3 keep it inline
+        return document.get('extractedText')
+
+    response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    data = response['Body'].read()
+    if response.get('ContentEncoding') == 'gzip':
+        data = gzip.decompress(data)
+    return data.decode('utf-8')
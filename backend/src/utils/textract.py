@@ -1,15 +1,30 @@
 """
 Amazon Textract utility functions for document text extraction.
 """
-import boto3
+import io
 import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterator, List, Optional
 
-# Initialize Textract client
-textract = boto3.client(
-    service_name='textract',
-    region_name=os.environ.get('AWS_REGION', 'us-east-1')
-)
+from pypdf import PdfReader, PdfWriter
+
+from utils.aws import client
+
+# Largest page size GetDocumentTextDetection allows
+RESULTS_PAGE_SIZE = 1000
+
+# Concurrent synchronous detection calls for multi-page PDFs
+PAGE_WORKERS = 8
+
+
+@lru_cache(maxsize=1)
+def get_textract():
+    """Get the Textract client, created on first use."""
+    return client(
+        'textract',
+        region_name=os.environ.get('AWS_REGION', 'us-east-1')
+    )
 
 
 def extract_text_from_s3(bucket: str, key: str) -> dict:
@@ -23,7 +38,7 @@ def extract_text_from_s3(bucket: str, key: str) -> dict:
     Returns:
         Dictionary with extracted text and metadata
     """
-    response = textract.detect_document_text(
+    response = get_textract().detect_document_text(
         Document={
             'S3Object': {
                 'Bucket': bucket,
@@ -32,25 +47,7 @@ def extract_text_from_s3(bucket: str, key: str) -> dict:
         }
     )
     
-    # Extract all text blocks
-    text_blocks = []
-    lines = []
-    words = []
-    
-    for block in response.get('Blocks', []):
-        if block['BlockType'] == 'LINE':
-            lines.append(block['Text'])
-        elif block['BlockType'] == 'WORD':
-            words.append(block['Text'])
-    
-    full_text = '\n'.join(lines)
-    
-    return {
-        'text': full_text,
-        'line_count': len(lines),
-        'word_count': len(words),
-        'confidence': _calculate_average_confidence(response.get('Blocks', []))
-    }
+    return _text_result(_parse_blocks(response.get('Blocks', [])))
 
 
 def extract_text_from_bytes(document_bytes: bytes) -> dict:
@@ -63,29 +60,39 @@ def extract_text_from_bytes(document_bytes: bytes) -> dict:
     Returns:
         Dictionary with extracted text and metadata
     """
-    response = textract.detect_document_text(
+    response = get_textract().detect_document_text(
         Document={
             'Bytes': document_bytes
         }
     )
     
-    lines = []
-    words = []
+    return _text_result(_parse_blocks(response.get('Blocks', [])))
+
+
+def extract_text_from_pdf_bytes(document_bytes: bytes, max_workers: int = PAGE_WORKERS) -> dict:
+    """
+    Extract text from a PDF of any length using synchronous Textract calls.
     
-    for block in response.get('Blocks', []):
-        if block['BlockType'] == 'LINE':
-            lines.append(block['Text'])
-        elif block['BlockType'] == 'WORD':
-            words.append(block['Text'])
+    Synchronous detection only accepts single-page PDFs, so the document is
+    split into pages that are detected in parallel and merged in page order.
+    
+    Args:
+        document_bytes: The PDF content as bytes
+        max_workers: Maximum concurrent Textract calls
+        
+    Returns:
+        Dictionary with extracted text and metadata
+    """
+    pages = _split_pdf_pages(document_bytes)
     
-    full_text = '\n'.join(lines)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        page_blocks = executor.map(_detect_page_blocks, pages)
+        
+        parsed = None
+        for blocks in page_blocks:
+            parsed = _parse_blocks(blocks, parsed)
     
-    return {
-        'text': full_text,
-        'line_count': len(lines),
-        'word_count': len(words),
-        'confidence': _calculate_average_confidence(response.get('Blocks', []))
-    }
+    return _text_result(parsed or _parse_blocks([]))
 
 
 def analyze_document_s3(bucket: str, key: str, feature_types: Optional[list] = None) -> dict:
@@ -103,7 +110,7 @@ def analyze_document_s3(bucket: str, key: str, feature_types: Optional[list] = N
     if feature_types is None:
         feature_types = ['TABLES', 'FORMS']
     
-    response = textract.analyze_document(
+    response = get_textract().analyze_document(
         Document={
             'S3Object': {
                 'Bucket': bucket,
@@ -123,14 +130,18 @@ def analyze_document_s3(bucket: str, key: str, feature_types: Optional[list] = N
     lines = []
     key_value_pairs = []
     
-    for block in response.get('Blocks', []):
+    blocks = response.get('Blocks', [])
+    by_id = {block['Id']: block for block in blocks}
+    text_cache = {}  # Resolved text per block ID
+    
+    for block in blocks:
         if block['BlockType'] == 'LINE':
             lines.append(block['Text'])
         elif block['BlockType'] == 'KEY_VALUE_SET':
             if 'KEY' in block.get('EntityTypes', []):
                 # This is a key, find its value
-                key_text = _get_text_from_block(block, response['Blocks'])
-                value_text = _get_value_for_key(block, response['Blocks'])
+                key_text = _get_text_from_block(block, by_id, text_cache)
+                value_text = _get_value_for_key(block, by_id, text_cache)
                 if key_text:
                     key_value_pairs.append({
                         'key': key_text,
@@ -143,7 +154,13 @@ def analyze_document_s3(bucket: str, key: str, feature_types: Optional[list] = N
     return result
 
 
-def start_async_analysis(bucket: str, key: str, sns_topic_arn: str, role_arn: str) -> str:
+def start_async_analysis(
+    bucket: str,
+    key: str,
+    sns_topic_arn: str,
+    role_arn: str,
+    job_tag: Optional[str] = None
+) -> str:
     """
     Start asynchronous document analysis for large documents.
     
@@ -152,22 +169,27 @@ def start_async_analysis(bucket: str, key: str, sns_topic_arn: str, role_arn: st
         key: S3 object key
         sns_topic_arn: SNS topic ARN for notifications
         role_arn: IAM role ARN for Textract
+        job_tag: Optional tag echoed back in the completion notification
         
     Returns:
         Job ID for tracking the analysis
     """
-    response = textract.start_document_text_detection(
-        DocumentLocation={
+    params = {
+        'DocumentLocation': {
             'S3Object': {
                 'Bucket': bucket,
                 'Name': key
             }
         },
-        NotificationChannel={
+        'NotificationChannel': {
             'SNSTopicArn': sns_topic_arn,
             'RoleArn': role_arn
         }
-    )
+    }
+    if job_tag:
+        params['JobTag'] = job_tag
+    
+    response = get_textract().start_document_text_detection(**params)
     
     return response['JobId']
 
@@ -182,7 +204,7 @@ def get_async_results(job_id: str) -> dict:
     Returns:
         Dictionary with job status and results
     """
-    response = textract.get_document_text_detection(JobId=job_id)
+    response = get_textract().get_document_text_detection(JobId=job_id, MaxResults=RESULTS_PAGE_SIZE)
     
     if response['JobStatus'] != 'SUCCEEDED':
         return {
@@ -190,62 +212,130 @@ def get_async_results(job_id: str) -> dict:
             'text': None
         }
     
-    lines = []
-    for block in response.get('Blocks', []):
-        if block['BlockType'] == 'LINE':
-            lines.append(block['Text'])
+    parsed = None
+    for page in _detection_pages(job_id, response):
+        parsed = _parse_blocks(page.get('Blocks', []), parsed)
     
-    # Handle pagination
-    next_token = response.get('NextToken')
-    while next_token:
-        response = textract.get_document_text_detection(
-            JobId=job_id,
-            NextToken=next_token
-        )
-        for block in response.get('Blocks', []):
-            if block['BlockType'] == 'LINE':
-                lines.append(block['Text'])
-        next_token = response.get('NextToken')
+    result = _text_result(parsed)
+    result['status'] = 'SUCCEEDED'
+    return result
+
+
+def _detection_pages(job_id: str, response: dict) -> Iterator[dict]:
+    """
+    Yield text detection result pages, starting from the first response.
     
-    return {
-        'status': 'SUCCEEDED',
-        'text': '\n'.join(lines),
-        'line_count': len(lines)
-    }
+    Textract has no paginator for this call and each NextToken comes from
+    the previous page, so pages can't be fetched in parallel. Instead the
+    next page is requested in the background while the caller parses the
+    current one.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while True:
+            next_token = response.get('NextToken')
+            next_page = executor.submit(
+                get_textract().get_document_text_detection,
+                JobId=job_id,
+                MaxResults=RESULTS_PAGE_SIZE,
+                NextToken=next_token
+            ) if next_token else None
+            
+            yield response
+            
+            if next_page is None:
+                return
+            response = next_page.result()
+
+
+def _split_pdf_pages(document_bytes: bytes) -> List[bytes]:
+    """Split a PDF into single-page PDFs."""
+    reader = PdfReader(io.BytesIO(document_bytes))
+    
+    pages = []
+    for page in reader.pages:
+        writer = PdfWriter()
+        writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pages.append(buffer.getvalue())
+    
+    return pages
+
+
+def _detect_page_blocks(page_bytes: bytes) -> list:
+    """Run synchronous text detection on a single-page document."""
+    response = get_textract().detect_document_text(Document={'Bytes': page_bytes})
+    return response.get('Blocks', [])
 
 
-def _calculate_average_confidence(blocks: list) -> float:
-    """Calculate average confidence score from Textract blocks."""
-    confidences = [
-        block.get('Confidence', 0) 
-        for block in blocks 
-        if 'Confidence' in block
-    ]
+def _parse_blocks(blocks: list, parsed: Optional[dict] = None) -> dict:
+    """
+    Collect lines, word count and confidence totals in one pass over blocks.
+    
+    Pass the result of a previous call as parsed to accumulate across pages.
+    """
+    if parsed is None:
+        parsed = {'lines': [], 'word_count': 0, 'confidence_sum': 0.0, 'confidence_count': 0}
+    
+    add_line = parsed['lines'].append
+    word_count = parsed['word_count']
+    confidence_sum = parsed['confidence_sum']
+    confidence_count = parsed['confidence_count']
     
-    if not confidences:
-        return 0.0
+    for block in blocks:
+        # WORD blocks outnumber LINE blocks several to one, so test them first
+        block_type = block['BlockType']
+        if block_type == 'WORD':
+            word_count += 1
+        elif block_type == 'LINE':
+            add_line(block['Text'])
+        if 'Confidence' in block:
+            confidence_sum += block['Confidence']
+            confidence_count += 1
     
-    return sum(confidences) / len(confidences)
+    parsed['word_count'] = word_count
+    parsed['confidence_sum'] = confidence_sum
+    parsed['confidence_count'] = confidence_count
+    return parsed
 
 
-def _get_text_from_block(block: dict, all_blocks: list) -> str:
-    """Extract text from a block and its relationships."""
+def _text_result(parsed: dict) -> dict:
+    """Build the extraction result from _parse_blocks output."""
+    lines = parsed['lines']
+    count = parsed['confidence_count']
+    
+    return {
+        'text': '\n'.join(lines),
+        'line_count': len(lines),
+        'word_count': parsed['word_count'],
+        'confidence': parsed['confidence_sum'] / count if count else 0.0
+    }
+
+
+def _get_text_from_block(block: dict, by_id: dict, text_cache: dict) -> str:
+    """Extract text from a block and its relationships, memoized by block ID."""
     if 'Text' in block:
         return block['Text']
     
+    cached = text_cache.get(block['Id'])
+    if cached is not None:
+        return cached
+    
     text_parts = []
     if 'Relationships' in block:
         for relationship in block['Relationships']:
             if relationship['Type'] == 'CHILD':
                 for child_id in relationship['Ids']:
-                    for b in all_blocks:
-                        if b['Id'] == child_id and 'Text' in b:
-                            text_parts.append(b['Text'])
+                    child = by_id.get(child_id)
+                    if child and 'Text' in child:
+                        text_parts.append(child['Text'])
     
-    return ' '.join(text_parts)
+    text = ' '.join(text_parts)
+    text_cache[block['Id']] = text
+    return text
 
 
-def _get_value_for_key(key_block: dict, all_blocks: list) -> Optional[str]:
+def _get_value_for_key(key_block: dict, by_id: dict, text_cache: dict) -> Optional[str]:
     """Find the value associated with a key block."""
     if 'Relationships' not in key_block:
         return None
@@ -253,8 +343,8 @@ def _get_value_for_key(key_block: dict, all_blocks: list) -> Optional[str]:
     for relationship in key_block['Relationships']:
         if relationship['Type'] == 'VALUE':
             for value_id in relationship['Ids']:
-                for block in all_blocks:
-                    if block['Id'] == value_id:
-                        return _get_text_from_block(block, all_blocks)
+                value_block = by_id.get(value_id)
+                if value_block:
+                    return _get_text_from_block(value_block, by_id, text_cache)
     
     return None
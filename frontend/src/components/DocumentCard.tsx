@@ -13,6 +13,7 @@ export default function DocumentCard({ document, onDelete, isDeleting }: Documen
     const styles = {
       UPLOADED: 'bg-blue-100 text-blue-700',
       PROCESSING: 'bg-yellow-100 text-yellow-700',
+      EXTRACTING: 'bg-orange-100 text-orange-700',
       EXTRACTED: 'bg-purple-100 text-purple-700',
       COMPLETED: 'bg-green-100 text-green-700',
       FAILED: 'bg-red-100 text-red-700',
@@ -156,6 +156,7 @@ export default function DocumentPage() {
       case 'EXTRACTED':
         return <CheckCircle className="w-5 h-5 text-green-500" />;
       case 'PROCESSING':
+      case 'EXTRACTING':
         return <Loader2 className="w-5 h-5 text-yellow-500 animate-spin" />;
       case 'FAILED':
         return <AlertCircle className="w-5 h-5 text-red-500" />;
@@ -26,13 +26,12 @@ export const documentService = {
     return response.data;
   },
 
-  // Upload file to S3 using presigned URL
-  async uploadToS3(uploadUrl: string, file: File): Promise<void> {
-    await axios.put(uploadUrl, file, {
-      headers: {
-        'Content-Type': file.type,
-      },
-    });
+  // Upload file to S3 using presigned POST (a CORS-simple request, no preflight)
+  async uploadToS3(uploadUrl: string, fields: Record<string, string>, file: File): Promise<void> {
+    const form = new FormData();
+    Object.entries(fields).forEach(([name, value]) => form.append(name, value));
+    form.append('file', file);
+    await axios.post(uploadUrl, form);
   },
 
   // Confirm upload and create document record
@@ -55,14 +54,14 @@ export const documentService = {
 
   // Full upload flow
   async uploadDocument(file: File): Promise<Document> {
-    // Step 1: Get presigned URL
-    const { uploadUrl, documentId, s3Key } = await this.getUploadUrl(
+    // Step 1: Get presigned POST
+    const { uploadUrl, fields, documentId, s3Key } = await this.getUploadUrl(
       file.name,
       file.type
     );
 
     // Step 2: Upload to S3
-    await this.uploadToS3(uploadUrl, file);
+    await this.uploadToS3(uploadUrl, fields, file);
 
     // Step 3: Confirm upload
     const { document } = await this.confirmUpload(
@@ -77,9 +76,12 @@ export const documentService = {
   },
 
   // List all documents
-  async listDocuments(limit = 50): Promise<{ documents: Document[]; count: number }> {
+  async listDocuments(
+    limit = 50,
+    nextToken?: string
+  ): Promise<{ documents: Document[]; count: number; nextToken?: string }> {
     const response = await api.get('/documents', {
-      params: { limit },
+      params: { limit, nextToken },
     });
     return response.data;
   },
@@ -5,7 +5,7 @@ export interface Document {
   s3Key: string;
   contentType: string;
   fileSize: number;
-  status: 'UPLOADED' | 'PROCESSING' | 'EXTRACTED' | 'COMPLETED' | 'FAILED';
+  status: 'UPLOADED' | 'PROCESSING' | 'EXTRACTING' | 'EXTRACTED' | 'COMPLETED' | 'FAILED';
   createdAt: string;
   updatedAt: string;
   summary?: string;
@@ -24,6 +24,7 @@ export interface QueryHistoryItem {
 
 export interface UploadResponse {
   uploadUrl: string;
+  fields: Record<string, string>;
   documentId: string;
   s3Key: string;
   expiresIn: number;
@@ -51,4 +52,5 @@ export interface QueryResponse {
   question: string;
   answer: string;
   confidence: 'high' | 'medium' | 'low';
+  cached?: boolean;
 }